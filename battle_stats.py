@@ -0,0 +1,711 @@
+import math
+import os
+import random
+import sys
+from argparse import ArgumentParser
+from multiprocessing import Pool
+from make_deck import make_deck
+from cat_policy import (OWNER_POLICIES, POLICY_DIR, UNKNOWN_ACTION,
+                        deal_owner_decks, deck_signature, load_policy,
+                        simulate_card, state_index)
+from game import cat_card_choice
+
+# every accumulator here keeps a fixed amount of state no matter how many
+# games are added, and has a merge() so results from separate worker
+# processes can be combined at the end of a run
+
+
+class RunningStats:
+    """
+    Running mean and variance of a stream of numbers using Welford's method
+
+    Attributes:
+        count (int): how many values have been added
+        mean (float): mean of the values so far
+        m2 (float): sum of squared distances from the mean
+        minimum (float): smallest value so far (None if empty)
+        maximum (float): largest value so far (None if empty)
+    """
+
+    def __init__(self):
+        """
+        Creates an empty RunningStats object
+        """
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        """
+        Adds one value to the running totals
+
+        Args:
+            value (float): the value to add
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        """
+        Combines another RunningStats into this one as if every value had
+        been added here (Chan et al. parallel update)
+
+        Args:
+            other (RunningStats): the stats to fold in
+        """
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.minimum, self.maximum = other.minimum, other.maximum
+            return
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    def variance(self):
+        """
+        Returns:
+            float: sample variance, 0.0 with fewer than two values
+        """
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    def stdev(self):
+        """
+        Returns:
+            float: sample standard deviation
+        """
+        return math.sqrt(self.variance())
+
+    def confidence_interval(self, z=1.96):
+        """
+        Normal approximation confidence interval for the mean
+
+        Args:
+            z (float, optional): z score of the interval (default is 95%)
+
+        Returns:
+            tuple: (low, high)
+        """
+        if self.count == 0:
+            return 0.0, 0.0
+        margin = z * self.stdev() / math.sqrt(self.count)
+        return self.mean - margin, self.mean + margin
+
+    def __str__(self):
+        """
+        Returns a one line summary of the stats
+        """
+        if self.count == 0:
+            return "no data"
+        return (f"mean {self.mean:.2f} (sd {self.stdev():.2f}), "
+                + f"min {self.minimum}, max {self.maximum}")
+
+
+class CardCounter:
+    """
+    Counts how often each card was played, how often it landed, and how much
+    damage it did in total. Memory grows with the number of distinct cards,
+    not games
+
+    Attributes:
+        cards (dict): card name -> [plays, hits, damage]
+    """
+
+    def __init__(self):
+        """
+        Creates an empty CardCounter object
+        """
+        self.cards = dict()
+
+    def add(self, name, landed, damage):
+        """
+        Records one play of a card
+
+        Args:
+            name (str): name of the card played
+            landed (bool): whether the card hit
+            damage (int): damage the card did
+        """
+        counts = self.cards.get(name)
+        if counts is None:
+            counts = self.cards[name] = [0, 0, 0]
+        counts[0] += 1
+        if landed:
+            counts[1] += 1
+            counts[2] += damage
+
+    def merge(self, other):
+        """
+        Adds another CardCounter's counts into this one
+
+        Args:
+            other (CardCounter): the counts to fold in
+        """
+        for name, (plays, hits, damage) in other.cards.items():
+            counts = self.cards.setdefault(name, [0, 0, 0])
+            counts[0] += plays
+            counts[1] += hits
+            counts[2] += damage
+
+
+class Reservoir:
+    """
+    Keeps a uniform random sample of at most size items from a stream of
+    any length (reservoir sampling, algorithm R)
+
+    Attributes:
+        size (int): most items kept
+        seen (int): how many items have been offered
+        samples (list): the items currently kept
+    """
+
+    def __init__(self, size=10, seed=None):
+        """
+        Creates an empty Reservoir object
+
+        Args:
+            size (int, optional): most items kept
+            seed (int, optional): seed for the sampling
+        """
+        self.size = size
+        self.seen = 0
+        self.samples = list()
+        self._rng = random.Random(seed)
+        self._next = 0
+
+    def add(self, item):
+        """
+        Offers one item to the sample
+
+        Args:
+            item (any): the item
+        """
+        if self.wants():
+            self.keep(item)
+        else:
+            self.skip()
+
+    def wants(self):
+        """
+        Tells whether the next add() could keep its item, so callers can skip
+        building records that would be thrown away. Must be followed by keep()
+        or skip() for the next item
+
+        Returns:
+            bool
+        """
+        if len(self.samples) < self.size:
+            return True
+        self._next = self._rng.randrange(self.seen + 1)
+        return self._next < self.size
+
+    def skip(self):
+        """
+        Counts an item that wants() said would not be kept
+        """
+        self.seen += 1
+
+    def keep(self, item):
+        """
+        Adds an item that wants() said would be kept
+        """
+        self.seen += 1
+        if len(self.samples) < self.size:
+            self.samples.append(item)
+        else:
+            self.samples[self._next] = item
+
+    def merge(self, other):
+        """
+        Combines another reservoir into this one. Each kept slot is filled
+        from one side or the other in proportion to how many items that side
+        has seen, so the result is still a sample of the combined stream
+
+        Args:
+            other (Reservoir): the sample to fold in
+        """
+        mine = list(self.samples)
+        theirs = list(other.samples)
+        self._rng.shuffle(mine)
+        self._rng.shuffle(theirs)
+        share = self.seen / (self.seen + other.seen) if other.seen else 1.0
+
+        self.samples = list()
+        while len(self.samples) < self.size and (mine or theirs):
+            if theirs and (not mine or self._rng.random() >= share):
+                self.samples.append(theirs.pop())
+            else:
+                self.samples.append(mine.pop())
+        self.seen += other.seen
+
+
+class QuantileSketch:
+    """
+    Approximate quantiles of non-negative numbers in bounded memory. Values
+    are counted in equal width bins; whenever there would be more than
+    max_bins bins the width doubles and neighbouring bins are joined, so a
+    quantile is never off by more than one bin width
+
+    Attributes:
+        max_bins (int): most bins kept
+        width (int): current bin width
+        bins (dict): bin number -> count
+        count (int): how many values have been added
+    """
+
+    def __init__(self, max_bins=256):
+        """
+        Creates an empty QuantileSketch object
+
+        Args:
+            max_bins (int, optional): most bins kept
+        """
+        self.max_bins = max_bins
+        self.width = 1
+        self.bins = dict()
+        self.count = 0
+
+    def _widen(self, width):
+        """
+        Rebins everything into bins of the given width
+        """
+        factor = width // self.width
+        bins = dict()
+        for index, count in self.bins.items():
+            bins[index // factor] = bins.get(index // factor, 0) + count
+        self.bins = bins
+        self.width = width
+
+    def add(self, value, count=1):
+        """
+        Adds a value to the sketch
+
+        Args:
+            value (int): the value to add
+            count (int, optional): how many times to add it
+        """
+        index = int(value) // self.width
+        self.bins[index] = self.bins.get(index, 0) + count
+        self.count += count
+        while len(self.bins) > self.max_bins:
+            self._widen(self.width * 2)
+
+    def merge(self, other):
+        """
+        Adds another sketch's counts into this one
+
+        Args:
+            other (QuantileSketch): the sketch to fold in
+        """
+        if other.width > self.width:
+            self._widen(other.width)
+        factor = self.width // other.width
+        for index, count in other.bins.items():
+            self.bins[index // factor] = self.bins.get(index // factor, 0) \
+                + count
+        self.count += other.count
+        while len(self.bins) > self.max_bins:
+            self._widen(self.width * 2)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile
+
+        Args:
+            q (float): between 0 and 1, e.g. 0.5 for the median
+
+        Returns:
+            float: the middle of the bin the quantile falls in, None if empty
+        """
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                break
+        return index * self.width + (self.width - 1) / 2
+
+
+def wilson_interval(wins, games, z=1.96):
+    """Wilson score confidence interval for a win rate, which stays sensible
+    close to 0% and 100% where the normal approximation does not
+
+    Args:
+        wins (int): games won
+        games (int): games played
+        z (float, optional): z score of the interval (default is 95%)
+
+    Returns:
+        tuple: (low, high)
+    """
+    if games == 0:
+        return 0.0, 1.0
+    rate = wins / games
+    denominator = 1 + z * z / games
+    centre = (rate + z * z / (2 * games)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / games
+                           + z * z / (4 * games * games)) / denominator
+    return max(centre - margin, 0.0), min(centre + margin, 1.0)
+
+
+class DeckStats:
+    """
+    Outcome statistics for every game played by one cat deck
+
+    Attributes:
+        name (str): description of the deck
+        games (int): games played
+        wins (int): games the cat won
+        draws (int): games stopped before anyone won
+        turns (RunningStats): game lengths
+        winner_hp (RunningStats): health the winner had left, draws left out
+        lengths (QuantileSketch): game lengths, for quantiles
+    """
+
+    def __init__(self, name):
+        """
+        Creates an empty DeckStats object
+
+        Args:
+            name (str): description of the deck
+        """
+        self.name = name
+        self.games = 0
+        self.wins = 0
+        self.draws = 0
+        self.turns = RunningStats()
+        self.winner_hp = RunningStats()
+        self.lengths = QuantileSketch()
+
+    def add(self, cat_won, turns, winner_hp=None):
+        """
+        Records one finished game
+
+        Args:
+            cat_won (bool or None): whether the cat won, None for a draw
+            turns (int): how many turns the game lasted
+            winner_hp (int, optional): health the winner had left, not
+                needed for a draw
+        """
+        self.games += 1
+        self.turns.add(turns)
+        self.lengths.add(turns)
+        if cat_won is None:
+            self.draws += 1
+            return
+        if cat_won:
+            self.wins += 1
+        self.winner_hp.add(winner_hp)
+
+    def merge(self, other):
+        """
+        Combines another DeckStats for the same deck into this one
+
+        Args:
+            other (DeckStats): the stats to fold in
+        """
+        self.games += other.games
+        self.wins += other.wins
+        self.draws += other.draws
+        self.turns.merge(other.turns)
+        self.winner_hp.merge(other.winner_hp)
+        self.lengths.merge(other.lengths)
+
+    def win_rate(self):
+        """
+        Returns:
+            float: fraction of the games with a winner that the cat won
+        """
+        decided = self.games - self.draws
+        return self.wins / decided if decided else 0.0
+
+
+class BattleStats:
+    """
+    Everything collected over a simulation run, in constant memory
+
+    Attributes:
+        decks (dict): deck signature -> DeckStats
+        cards (CardCounter): plays, hits and damage per card
+        samples (Reservoir): full turn by turn records of a few games
+    """
+
+    def __init__(self, sample_size=10, seed=None):
+        """
+        Creates an empty BattleStats object
+
+        Args:
+            sample_size (int, optional): how many full games to keep
+            seed (int, optional): seed for the game sample
+        """
+        self.decks = dict()
+        self.cards = CardCounter()
+        self.samples = Reservoir(sample_size, seed)
+
+    def deck(self, signature, name):
+        """
+        Returns the DeckStats for a deck, creating it the first time
+
+        Args:
+            signature (str): deck signature from cat_policy.deck_signature
+            name (str): description of the deck
+        """
+        stats = self.decks.get(signature)
+        if stats is None:
+            stats = self.decks[signature] = DeckStats(name)
+        return stats
+
+    def merge(self, other):
+        """
+        Combines the results of another run into this one
+
+        Args:
+            other (BattleStats): the results to fold in
+        """
+        for signature, stats in other.decks.items():
+            self.deck(signature, stats.name).merge(stats)
+        self.cards.merge(other.cards)
+        self.samples.merge(other.samples)
+
+    def report(self):
+        """
+        Techniques: f-strings
+
+        Returns:
+            str: readable summary of the run
+        """
+        lines = list()
+        for stats in self.decks.values():
+            low, high = wilson_interval(stats.wins,
+                                        stats.games - stats.draws)
+            lines.append(f'Cat deck: {stats.name}')
+            lines.append(f'\tgames: {stats.games}, draws: {stats.draws}, '
+                         + f'cat win rate: {stats.win_rate():.2%} '
+                         + f'(95% CI {low:.2%} to {high:.2%})')
+            lines.append(f'\tturns: {stats.turns}')
+            lines.append('\tturn quantiles: ' + ', '.join(
+                f'p{int(q * 100)} {stats.lengths.quantile(q)}'
+                for q in (0.5, 0.9, 0.99)))
+            lines.append(f'\twinner hp left: {stats.winner_hp}')
+
+        lines.append('Cards:')
+        for name, (plays, hits, damage) in sorted(self.cards.cards.items()):
+            lines.append(f'\t{name}: played {plays}, hit rate '
+                         + f'{hits / plays:.2%}, damage per play '
+                         + f'{damage / plays:.2f}')
+        return '\n'.join(lines)
+
+
+def _simulate_worker(job):
+    """Plays a batch of headless games and collects their statistics. Runs in
+    its own process when the simulation is parallel
+
+    Args:
+        job (tuple): (cat decks, games, seed, owner policy names, owner hp,
+            cat hp, sample size, max turns, policy directory)
+
+    Returns:
+        BattleStats object
+    """
+    (cat_decks, games, seed, owner_policies, owner_hp, cat_hp, sample_size,
+     max_turns, policy_dir) = job
+    rng = random.Random(seed)
+    stats = BattleStats(sample_size, seed)
+    owner_decks = deal_owner_decks(seed)
+    owner_moves = [OWNER_POLICIES[name] for name in owner_policies]
+
+    cats = list()
+    for deck in cat_decks:
+        cards, signature = deck_signature(deck)
+        name = ', '.join(card.name for card in cards)
+        cats.append((deck, load_policy(deck, policy_dir),
+                     stats.deck(signature, name)))
+
+    for _ in range(games):
+        cat_deck, policy, deck_stats = rng.choice(cats)
+        owner_deck = rng.choice(owner_decks)
+        owner_move = rng.choice(owner_moves)
+        owner = [owner_hp, 1.0, 1.0]
+        cat = [cat_hp, 1.0, 1.0]
+        record = list() if stats.samples.wants() else None
+        cat_won = None
+        fear_count = 1
+
+        for turn in range(1, max_turns + 1):
+            card = owner_move(owner_deck, owner, cat, rng)
+            landed, damage = simulate_card(card, owner, cat, rng)
+            stats.cards.add(card.name, landed, damage)
+            if record is not None:
+                record.append((turn, 'Player', card.name, landed, damage))
+            if cat[0] <= 0:
+                cat_won = False
+                break
+
+            card = None
+            if policy is not None:
+                action = policy.table[state_index(owner[0], cat[0], owner[1],
+                                                  owner[2], cat[1], cat[2])]
+                if action != UNKNOWN_ACTION:
+                    card = policy.cards[action]
+            if card is None:
+                # same fallback as game.py when there is no trained choice
+                card, scared = cat_card_choice(owner[0], cat[0], cat_deck,
+                                               owner_deck, fear_count, rng)
+                if scared:
+                    fear_count += 1
+            landed, damage = simulate_card(card, cat, owner, rng)
+            stats.cards.add(card.name, landed, damage)
+            if record is not None:
+                record.append((turn, 'Cat', card.name, landed, damage))
+            if owner[0] <= 0:
+                cat_won = True
+                break
+
+        if cat_won is None:
+            deck_stats.add(None, turn)
+        else:
+            deck_stats.add(cat_won, turn, cat[0] if cat_won else owner[0])
+        if record is not None:
+            stats.samples.keep(record)
+        else:
+            stats.samples.skip()
+
+    return stats
+
+
+def simulate(cat_decks, games, owner_policies=('random', 'attack', 'greedy'),
+             owner_hp=100, cat_hp=100, workers=None, batch_size=50000,
+             sample_size=10, max_turns=200, seed=None,
+             policy_dir=POLICY_DIR):
+    """Techniques: multiprocessing, optional parameters
+
+    Plays many headless games between random owner decks and the given cat
+    decks, merging each batch's statistics as it finishes so memory stays
+    the same whether the run is a thousand games or a hundred million. Cats
+    play like they do in game.py, using their trained policy if one exists
+    and computer_card_draw's rules for anything it doesn't cover
+
+    Args:
+        cat_decks (list): list of cat decks (lists of Card objects)
+        games (int): total games to play
+        owner_policies (sequence of str, optional): names from OWNER_POLICIES
+            to pick the owner's play style from each game
+        owner_hp (int, optional): starting health of the owner
+        cat_hp (int, optional): starting health of the cat
+        workers (int, optional): number of processes (default: all cores)
+        batch_size (int, optional): games per job handed to a worker
+        sample_size (int, optional): how many full games to keep
+        max_turns (int, optional): turns before a game is stopped and
+            counted as a draw
+        seed (int, optional): seed for a repeatable run
+        policy_dir (str, optional): folder of trained cat policies
+
+    Returns:
+        BattleStats object
+
+    Raises:
+        ValueError: If there are no cat decks, games is negative, max_turns
+            or batch_size is below 1, or an owner policy is unknown.
+    """
+    if not cat_decks:
+        raise ValueError("At least one cat deck is needed to simulate")
+    if games < 0:
+        raise ValueError("games can't be negative")
+    if max_turns < 1:
+        raise ValueError("max_turns must be at least 1")
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    for name in owner_policies:
+        if name not in OWNER_POLICIES:
+            raise ValueError(f"Unknown owner policy: {name}")
+
+    seeds = random.Random(seed)
+    jobs = ((cat_decks, min(batch_size, games - start), seeds.random(),
+             tuple(owner_policies), owner_hp, cat_hp, sample_size, max_turns,
+             policy_dir) for start in range(0, games, batch_size))
+    stats = BattleStats(sample_size, seed)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for job in jobs:
+            stats.merge(_simulate_worker(job))
+    else:
+        with Pool(workers) as pool:
+            for result in pool.imap(_simulate_worker, jobs):
+                stats.merge(result)
+    return stats
+
+
+def parse_args(arglist):
+    """Techniques: ArgumentParser
+
+    parses command line arguments for a simulation run
+
+    Args:
+        arglist (list of str): arguments from the command line
+
+    Returns:
+        namespace: the parsed arguments as a namespace
+    """
+    parser = ArgumentParser(description="simulate many headless battles")
+    parser.add_argument("-g", "--games", type=int, default=100000,
+        help="number of games to simulate")
+    parser.add_argument("-n", "--decks", type=int, default=3,
+        help="number of random cat decks to play with")
+    parser.add_argument("-o", "--owner-policy", nargs="+",
+        default=list(OWNER_POLICIES), choices=list(OWNER_POLICIES),
+        help="owner play styles to simulate")
+    parser.add_argument("-l", "--length", type=str, default="short",
+        choices=["short", "long"], help="length of the games")
+    parser.add_argument("-d", "--difficulty", type=str, default="easy",
+        choices=["easy", "hard"], help="difficulty of the games")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+        help="processes to simulate with (default: all cores)")
+    parser.add_argument("-s", "--seed", type=int, default=None,
+        help="seed for a repeatable run")
+    parser.add_argument("--samples", type=int, default=3,
+        help="number of full games to print at the end")
+    parser.add_argument("--policy-dir", type=str, default=POLICY_DIR,
+        help="folder of trained cat policies")
+
+    return parser.parse_args(arglist)
+
+
+if __name__ == "__main__":
+
+    args = parse_args(sys.argv[1:])
+    random.seed(args.seed)
+
+    # same starting health as game.py
+    owner_hp = 100 if args.length == "short" else 500
+    cat_hp = owner_hp + (100 if args.difficulty == "hard" else 0)
+
+    cat_decks = [make_deck('cat_cards.txt', 6, 15) for _ in range(args.decks)]
+    stats = simulate(cat_decks, args.games, args.owner_policy, owner_hp,
+                     cat_hp, args.workers, sample_size=args.samples,
+                     seed=args.seed, policy_dir=args.policy_dir)
+    print(stats.report())
+
+    for number, record in enumerate(stats.samples.samples):
+        print(f'\nSample game {number + 1}')
+        for turn, user, card, landed, damage in record:
+            result = f'hit for {damage}' if landed else 'missed'
+            print(f'\tTurn {turn}: {user} used {card}, {result}')
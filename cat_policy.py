@@ -0,0 +1,565 @@
+import hashlib
+import os
+import random
+import sys
+from argparse import ArgumentParser
+from array import array
+from multiprocessing import Pool
+from make_deck import all_decks, make_deck
+
+# a state is the six numbers the cat can see at the start of its turn, each
+# squashed into a small number of buckets:
+# - owner hp and cat hp in buckets of HP_BUCKET_WIDTH (the last bucket holds
+#   everything above it, so long games only matter once someone is close)
+# - owner attack/defense and cat attack/defense multipliers in MULT_BUCKETS
+#   bins split at MULT_EDGES
+HP_BUCKET_WIDTH = 15
+HP_BUCKETS = 10
+MULT_EDGES = (0.85, 1.05, 1.4)
+MULT_BUCKETS = len(MULT_EDGES) + 1
+STATE_COUNT = HP_BUCKETS * HP_BUCKETS * MULT_BUCKETS ** 4
+
+# policy table value for states that were never visited during training
+UNKNOWN_ACTION = -1
+
+POLICY_DIR = 'policies'
+
+
+def _mult_bucket(multiplier):
+    """Returns which of the MULT_BUCKETS bins a stat multiplier falls into
+    """
+    if multiplier < MULT_EDGES[0]:
+        return 0
+    elif multiplier < MULT_EDGES[1]:
+        return 1
+    elif multiplier < MULT_EDGES[2]:
+        return 2
+    return 3
+
+
+def state_index(owner_hp, cat_hp, owner_attack, owner_defense, cat_attack,
+                cat_defense):
+    """Techniques: mixed radix indexing
+
+    Flattens what the cat can see at the start of its turn into one index
+    into a policy or Q table
+
+    Args:
+        owner_hp (int): health points of the owner
+        cat_hp (int): health points of the cat
+        owner_attack (float): owner's attack multiplier
+        owner_defense (float): owner's defense multiplier
+        cat_attack (float): cat's attack multiplier
+        cat_defense (float): cat's defense multiplier
+
+    Returns:
+        int between 0 and STATE_COUNT - 1
+    """
+    index = min(owner_hp // HP_BUCKET_WIDTH, HP_BUCKETS - 1)
+    index = index * HP_BUCKETS + min(cat_hp // HP_BUCKET_WIDTH, HP_BUCKETS - 1)
+    index = index * MULT_BUCKETS + _mult_bucket(owner_attack)
+    index = index * MULT_BUCKETS + _mult_bucket(owner_defense)
+    index = index * MULT_BUCKETS + _mult_bucket(cat_attack)
+    index = index * MULT_BUCKETS + _mult_bucket(cat_defense)
+    return int(index)
+
+
+def deck_signature(deck):
+    """Sorts a deck by card name and makes a short name for its policy files.
+    The sorted order is also the action order in the tables, so the same
+    cards always map to the same table no matter how make_deck ordered them
+
+    Args:
+        deck (list): list of Card objects
+
+    Returns:
+        tuple of (list of Card objects sorted by name, str signature)
+    """
+    cards = sorted(deck, key=lambda c: c.name)
+    names = ';'.join(card.name for card in cards)
+    return cards, 'cat_' + hashlib.sha1(names.encode('utf-8')).hexdigest()[:12]
+
+
+class CatPolicy:
+    """
+    Trained lookup table that picks the cat's card in O(1) during play
+
+    Attributes:
+        cards (list): cat's Card objects sorted by name, indexed by the table
+        table (array): one signed byte per state holding the index of the
+            card to play, or UNKNOWN_ACTION if training never reached it
+    """
+
+    def __init__(self, cards, table):
+        """
+        Creates a CatPolicy object
+
+        Args:
+            cards (list): Card objects sorted by name
+            table (array): array('b') of length STATE_COUNT
+        """
+        self.cards = cards
+        self.table = table
+
+    def choose(self, owner, cat):
+        """
+        Looks up the card to play for the current state
+
+        Args:
+            owner (Player object): Player object representation of the owner
+            cat (Player object): Player object representation of the cat
+
+        Returns:
+            Card object, or None if the state was never seen in training
+        """
+        action = self.table[state_index(owner.health, cat.health,
+                                        owner.attack_multiplier,
+                                        owner.defense_multiplier,
+                                        cat.attack_multiplier,
+                                        cat.defense_multiplier)]
+        if action == UNKNOWN_ACTION:
+            return None
+        return self.cards[action]
+
+
+def _read_names(file):
+    """Reads the card name header line at the top of a policy or Q table file
+    """
+    return file.readline().decode('utf-8').rstrip('\n').split(';')
+
+
+def save_policy(deck, q_table, visits, episodes, directory=POLICY_DIR):
+    """Techniques: with statement
+
+    Writes the trained tables for a cat deck. The .policy file is the small
+    table read at play time, the .qtable file keeps the Q values and visit
+    counts so training can resume later
+
+    Args:
+        deck (list): list of the cat's Card objects
+        q_table (array): Q values, STATE_COUNT rows of one value per card
+        visits (array): how many updates each Q value has had
+        episodes (int): total number of training games played so far
+        directory (str, optional): folder to save into
+
+    Side effects:
+        creates directory if needed and writes two files into it
+
+    Returns:
+        str path of the .policy file
+    """
+    cards, signature = deck_signature(deck)
+    actions = len(cards)
+    names = (';'.join(card.name for card in cards) + '\n').encode('utf-8')
+    os.makedirs(directory, exist_ok=True)
+
+    policy = array('b', [UNKNOWN_ACTION]) * STATE_COUNT
+    for state in range(STATE_COUNT):
+        row = state * actions
+        # only choose between cards training actually played here, an
+        # untried card still has its starting Q of 0.0 which would beat
+        # every tried card in a losing state
+        tried = [action for action in range(actions) if visits[row + action]]
+        if tried:
+            policy[state] = max(tried, key=lambda a: q_table[row + a])
+
+    policy_path = os.path.join(directory, signature + '.policy')
+    with open(policy_path, 'wb') as file:
+        file.write(names)
+        policy.tofile(file)
+
+    with open(os.path.join(directory, signature + '.qtable'), 'wb') as file:
+        file.write(names)
+        array('Q', [episodes]).tofile(file)
+        array('f', q_table).tofile(file)
+        visits.tofile(file)
+
+    return policy_path
+
+
+def load_policy(deck, directory=POLICY_DIR):
+    """Techniques: with statement
+
+    Loads the play time lookup table for a cat deck if one has been trained
+
+    Args:
+        deck (list): list of the cat's Card objects
+        directory (str, optional): folder the policies were saved into
+
+    Returns:
+        CatPolicy object, or None if there is no table for this deck
+    """
+    cards, signature = deck_signature(deck)
+    try:
+        with open(os.path.join(directory, signature + '.policy'), 'rb') as file:
+            if _read_names(file) != [card.name for card in cards]:
+                return None
+            table = array('b')
+            table.fromfile(file, STATE_COUNT)
+    except (OSError, EOFError):
+        return None
+    return CatPolicy(cards, table)
+
+
+def load_q_table(deck, directory=POLICY_DIR):
+    """Techniques: with statement
+
+    Loads the Q values saved by save_policy so training can continue, or
+    makes empty tables if this deck hasn't been trained yet
+
+    Args:
+        deck (list): list of the cat's Card objects
+        directory (str, optional): folder the policies were saved into
+
+    Returns:
+        tuple of (array of Q values, array of visit counts, int episodes)
+    """
+    cards, signature = deck_signature(deck)
+    size = STATE_COUNT * len(cards)
+    try:
+        with open(os.path.join(directory, signature + '.qtable'), 'rb') as file:
+            if _read_names(file) == [card.name for card in cards]:
+                episodes = array('Q')
+                episodes.fromfile(file, 1)
+                q_values = array('f')
+                q_values.fromfile(file, size)
+                visits = array('I')
+                visits.fromfile(file, size)
+                return array('d', q_values), visits, episodes[0]
+    except (OSError, EOFError):
+        pass
+    return array('d', [0.0]) * size, array('I', [0]) * size, 0
+
+
+def simulate_card(card, user, target, rng):
+    """Headless version of apply_card_effect used for self-play. Follows the
+    same rules as resolve_attack and apply_card_effect but works on plain
+    [health, attack multiplier, defense multiplier] lists and skips the
+    printing and turn history file so millions of turns stay fast
+
+    Args:
+        card (Card): the card being played
+        user (list): [health, attack multiplier, defense multiplier] of the
+            player using the card
+        target (list): same for the player receiving the effect
+        rng (Random): random number generator to roll with
+
+    Side effects:
+        modifies user and target in place
+
+    Returns:
+        tuple: A tuple (bool, int) indicating whether the card landed and how
+        much damage it caused.
+    """
+    if rng.random() >= card.accuracy:
+        return False, 0
+
+    if card.type == 'attack':
+        damage = rng.randint(card.magnitude[0], card.magnitude[1])
+        damage = int(damage * user[1] / target[2])
+        target[0] = max(target[0] - damage, 0)
+        return True, damage
+
+    if card.type == 'attack buff':
+        user[1] *= card.magnitude
+    elif card.type == 'attack debuff':
+        target[1] *= 1 - card.magnitude
+    elif card.type == 'defense buff':
+        user[2] *= card.magnitude
+    elif card.type == 'defense debuff':
+        target[2] *= 1 - card.magnitude
+    return True, 0
+
+
+def random_owner(deck, owner, cat, rng):
+    """Owner policy that plays any card from the deck
+    """
+    return rng.choice(deck)
+
+
+def attacking_owner(deck, owner, cat, rng):
+    """Owner policy that mostly attacks, like computer_card_draw does for the
+    cat
+    """
+    attacks = [card for card in deck if card.type == 'attack']
+    if rng.random() < 0.7 or len(attacks) == len(deck):
+        return rng.choice(attacks)
+    return rng.choice([card for card in deck if card.type != 'attack'])
+
+
+def greedy_owner(deck, owner, cat, rng):
+    """Techniques: key function with max()
+
+    Owner policy that always plays the attack with the best expected damage
+    """
+    return max((card for card in deck if card.type == 'attack'),
+               key=lambda c: c.accuracy * sum(c.magnitude))
+
+
+OWNER_POLICIES = {
+    'random': random_owner,
+    'attack': attacking_owner,
+    'greedy': greedy_owner,
+}
+
+
+def deal_owner_decks(seed, count=32):
+    """Deals owner decks for a worker to play against. make_deck rolls with
+    the global random, which forked workers all inherit in the same state,
+    so it is seeded from the job while dealing to stay repeatable. The old
+    state is put back afterwards, so running a job in the calling process
+    leaves its random untouched
+
+    Args:
+        seed (int or float): seed of the worker's job
+        count (int, optional): how many decks to deal
+
+    Returns:
+        list of decks (lists of Card objects)
+    """
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        return [make_deck('player_cards.txt', 6, 15) for _ in range(count)]
+    finally:
+        random.setstate(state)
+
+
+def _train_worker(job):
+    """Techniques: tabular Q-learning
+
+    Plays headless games with an epsilon-greedy cat, updating a private copy
+    of the Q table. Runs in its own process when training is parallel
+
+    Args:
+        job (tuple): (cat cards sorted by name, Q array, episodes, seed,
+            owner policy names, owner hp, cat hp, alpha, gamma, epsilon,
+            max turns)
+
+    Returns:
+        tuple of (array of Q values, array('I') of updates per Q value)
+    """
+    (cards, q_table, episodes, seed, owner_policies, owner_hp, cat_hp, alpha,
+     gamma, epsilon, max_turns) = job
+    rng = random.Random(seed)
+    actions = len(cards)
+    visits = array('I', [0]) * len(q_table)
+    owner_decks = deal_owner_decks(seed)
+    owner_moves = [OWNER_POLICIES[name] for name in owner_policies]
+
+    def best(row):
+        values = q_table[row:row + actions]
+        return values.index(max(values))
+
+    for _ in range(episodes):
+        owner_deck = rng.choice(owner_decks)
+        owner_move = rng.choice(owner_moves)
+        owner = [owner_hp, 1.0, 1.0]
+        cat = [cat_hp, 1.0, 1.0]
+        previous = None
+
+        for _ in range(max_turns):
+            simulate_card(owner_move(owner_deck, owner, cat, rng), owner, cat,
+                          rng)
+            if cat[0] <= 0:
+                if previous is None:
+                    break
+                q_table[previous] += alpha * (-1.0 - q_table[previous])
+                visits[previous] += 1
+                break
+
+            row = state_index(owner[0], cat[0], owner[1], owner[2], cat[1],
+                              cat[2]) * actions
+            action = best(row)
+            if previous is not None:
+                target = gamma * q_table[row + action]
+                q_table[previous] += alpha * (target - q_table[previous])
+                visits[previous] += 1
+
+            if rng.random() < epsilon:
+                action = rng.randrange(actions)
+            previous = row + action
+            simulate_card(cards[action], cat, owner, rng)
+            if owner[0] <= 0:
+                q_table[previous] += alpha * (1.0 - q_table[previous])
+                visits[previous] += 1
+                break
+
+    return q_table, visits
+
+
+def _merge(q_table, visits, results):
+    """Folds the worker results of one training round back into the shared
+    tables, weighting each worker's Q value by how often it updated it
+
+    Side effects:
+        modifies q_table and visits in place
+    """
+    if len(results) == 1:
+        worker_q, worker_visits = results[0]
+        q_table[:] = worker_q
+        for index, count in enumerate(worker_visits):
+            if count:
+                visits[index] += count
+        return
+
+    for index in range(len(q_table)):
+        total = 0
+        weighted = 0.0
+        for worker_q, worker_visits in results:
+            count = worker_visits[index]
+            if count:
+                total += count
+                weighted += count * worker_q[index]
+        if total:
+            q_table[index] = weighted / total
+            visits[index] += total
+
+
+def train_policy(deck, episodes, owner_policies=('random', 'attack',
+                 'greedy'), owner_hp=100, cat_hp=100, workers=None,
+                 round_size=5000, alpha=0.1, gamma=0.99, epsilon=0.1,
+                 max_turns=200, seed=None, directory=POLICY_DIR):
+    """Techniques: multiprocessing, optional parameters
+
+    Trains a lookup table for one cat deck through headless self-play. Every
+    round each worker process plays round_size games from the current table,
+    then the results are merged and the next round starts from the merged
+    table. Continues from a saved table if this deck has been trained before
+
+    Args:
+        deck (list): list of the cat's Card objects
+        episodes (int): number of games to play in this run
+        owner_policies (sequence of str, optional): names from OWNER_POLICIES
+            to pick the owner's play style from each game
+        owner_hp (int, optional): starting health of the owner
+        cat_hp (int, optional): starting health of the cat
+        workers (int, optional): number of processes (default: all cores)
+        round_size (int, optional): games per worker between merges
+        alpha (float, optional): learning rate
+        gamma (float, optional): discount per cat turn
+        epsilon (float, optional): chance the cat explores a random card
+        max_turns (int, optional): turns before a game is called a draw
+        seed (int, optional): seed for repeatable training
+        directory (str, optional): folder to save into and resume from
+
+    Side effects:
+        writes the policy and Q table files for the deck
+
+    Returns:
+        str path of the .policy file
+    """
+    for name in owner_policies:
+        if name not in OWNER_POLICIES:
+            raise ValueError(f"Unknown owner policy: {name}")
+
+    cards = deck_signature(deck)[0]
+    q_table, visits, trained = load_q_table(deck, directory)
+    workers = workers or os.cpu_count() or 1
+    seeds = random.Random(seed)
+    remaining = episodes
+
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        while remaining > 0:
+            jobs = list()
+            for _ in range(workers):
+                count = min(round_size, remaining)
+                if count <= 0:
+                    break
+                remaining -= count
+                jobs.append((cards, q_table, count, seeds.random(),
+                             tuple(owner_policies), owner_hp, cat_hp, alpha,
+                             gamma, epsilon, max_turns))
+            if pool is None:
+                results = [_train_worker(job) for job in jobs]
+            else:
+                results = pool.map(_train_worker, jobs)
+            _merge(q_table, visits, results)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return save_policy(deck, q_table, visits, trained + episodes, directory)
+
+
+def parse_args(arglist):
+    """Techniques: ArgumentParser
+
+    parses command line arguments for training
+
+    Args:
+        arglist (list of str): arguments from the command line
+
+    Returns:
+        namespace: the parsed arguments as a namespace
+    """
+    parser = ArgumentParser(description="train cat policies by self-play")
+    parser.add_argument("-e", "--episodes", type=int, default=200000,
+        help="games to play per cat deck")
+    parser.add_argument("-n", "--decks", type=int, default=3,
+        help="number of different random cat decks to train")
+    parser.add_argument("-a", "--all", action="store_true",
+        help="train every cat deck the game can deal instead of random ones")
+    parser.add_argument("--list", action="store_true",
+        help="list every cat deck the game can deal and exit")
+    parser.add_argument("-o", "--owner-policy", nargs="+",
+        default=list(OWNER_POLICIES), choices=list(OWNER_POLICIES),
+        help="owner play styles to train against")
+    parser.add_argument("-l", "--length", type=str, default="short",
+        choices=["short", "long"], help="length of the games to train on")
+    parser.add_argument("-d", "--difficulty", type=str, default="easy",
+        choices=["easy", "hard"], help="difficulty of the games to train on")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+        help="processes to train with (default: all cores)")
+    parser.add_argument("-s", "--seed", type=int, default=None,
+        help="seed for repeatable training")
+    parser.add_argument("--policy-dir", type=str, default=POLICY_DIR,
+        help="folder to save policies into and resume from")
+
+    return parser.parse_args(arglist)
+
+
+if __name__ == "__main__":
+
+    args = parse_args(sys.argv[1:])
+    random.seed(args.seed)
+
+    # same starting health as game.py
+    owner_hp = 100 if args.length == "short" else 500
+    cat_hp = owner_hp + (100 if args.difficulty == "hard" else 0)
+
+    every_deck = all_decks('cat_cards.txt', 6, 15)
+    if args.list:
+        for number, deck in enumerate(every_deck):
+            print(f'Deck {number + 1}: '
+                  + ', '.join(card.name for card in deck_signature(deck)[0]))
+        sys.exit()
+
+    if args.all:
+        decks = every_deck
+    else:
+        # draw decks the way the game does, so common decks get trained
+        # first, until there are enough different ones
+        decks = list()
+        signatures = set()
+        duplicates = 0
+        while len(decks) < min(args.decks, len(every_deck)):
+            deck = make_deck('cat_cards.txt', 6, 15)
+            signature = deck_signature(deck)[1]
+            if signature in signatures:
+                duplicates += 1
+                continue
+            signatures.add(signature)
+            decks.append(deck)
+        if duplicates:
+            print(f'Skipped {duplicates} duplicate decks while drawing '
+                  + f'{len(decks)} different ones')
+
+    for number, deck in enumerate(decks):
+        path = train_policy(deck, args.episodes, args.owner_policy, owner_hp,
+                            cat_hp, args.workers, seed=args.seed,
+                            directory=args.policy_dir)
+        print(f'Trained {number + 1}/{len(decks)} '
+              + f'{", ".join(card.name for card in deck)}: {path}')
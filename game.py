@@ -4,6 +4,8 @@ from argparse import ArgumentParser
 from deck_selection import deck_selection
 from make_deck import make_deck
 from game_menu import game_menu
+from cat_policy import POLICY_DIR, load_policy
+from spectator import SpectatorFeed, turn_event
 
 class Player:
     """
@@ -185,6 +187,10 @@ def apply_card_effect(card, user, target, turn):
     Side effects:
         Modifies player stats or health in place.
         Prints the result of the card usage.
+
+    Returns:
+        tuple: A tuple (bool, int) indicating whether the card landed and how 
+        much damage it caused.
     """
     landed = True
     accuracy = card.accuracy * 100
@@ -210,6 +216,7 @@ def apply_card_effect(card, user, target, turn):
             
         turn_history(user.name, card.name, dmg, turn, \
             target.health, landed)
+        return hit, dmg
     
     else:    
         if card.type == 'attack buff' and landed:
@@ -235,6 +242,7 @@ def apply_card_effect(card, user, target, turn):
         
         turn_history(user.name, card.name, card.magnitude, turn, \
             target.health, landed)
+        return landed, 0
 
 
 def computer_card_draw(owner_hp, cat_hp, cat_deck, owner_deck, cat):
@@ -258,32 +266,59 @@ def computer_card_draw(owner_hp, cat_hp, cat_deck, owner_deck, cat):
     Returns:
         card object
     """
+    card, scared = cat_card_choice(owner_hp, cat_hp, cat_deck, owner_deck,
+                                   cat.fearCount)
+    if scared:
+        cat.fearCount += 1
+        print("Cat is afraid! He enrages and shows his meow-scles!")
+    return card
+
+
+def cat_card_choice(owner_hp, cat_hp, cat_deck, owner_deck, fear_count,
+                    rng=random):
+    """Techniques: list comprehensions, key function with max()
+    
+    The card choosing rules behind computer_card_draw, without printing or
+    changing the cat, so headless simulations can use the same cat as the 
+    game
+    
+    Args: 
+        owner_hp (int): health points of the owner (player)
+        cat_hp (int): health points of the cat (computer)
+        cat_deck (list): list of cat's card objects
+        owner_deck (list): list of owner's card objects
+        fear_count (int): the cat's fearCount, the cat only gets scared 
+            while it is 1
+        rng (Random or module, optional): what to roll with (default is the
+            random module)
+        
+    Returns:
+        tuple: (card object, bool whether the cat got scared this turn)
+    """
     cat_attacks = [card for card in cat_deck if card.type == 'attack']
     cat_powerups = [card for card in cat_deck if card.type[-4:] == 'buff']
     owner_attacks = [card for card in owner_deck if card.type == 'attack']
     
     # raise defense when owner is close to defeating the cat
     cat_defense = [card for card in cat_powerups if card.type == 'defense buff']
-    if cat.fearCount == 1:
+    if fear_count == 1:
         if len(cat_defense) > 0:
             for attack in owner_attacks:
                 if max(attack.magnitude) * 2 >= cat_hp:
                     cat_defense.sort(key=lambda c: c.magnitude, reverse=True)
-                    cat.fearCount += 1
-                    print("Cat is afraid! He enrages and shows his meow-scles!")
-                    return cat_defense[0]
+                    return cat_defense[0], True
             
     #draw attack card if can defeat owner 
     #chooses strongest possible attack for increased chance of winning 
     cat_attacks.sort(key=lambda c: max(c.magnitude), reverse=True)
     if max(cat_attacks[0].magnitude) >= owner_hp:
-        return cat_attacks[0]
+        return cat_attacks[0], False
         
     #choose between attack and powerup, greater chance of attack
-    if random.random() < 0.7 or len(cat_powerups) == 0:
-        return random.choice(cat_attacks)
+    if rng.random() < 0.7 or len(cat_powerups) == 0:
+        return rng.choice(cat_attacks), False
     else:
-        return random.choice(cat_powerups)
+        return rng.choice(cat_powerups), False
 
 
 def parse_args(arglist):
@@ -295,6 +330,8 @@ def parse_args(arglist):
     Optional arguments:
         -d, --difficulty: specify the difficulty of the battle
         -l, --length: specify the lenght of the game
+        -p, --policy-dir: folder of trained cat policies (see cat_policy.py)
+        -s, --spectate: share the battle with spectators on this port
     
     Args:
         arglist (list of str): arguments from the command line
@@ -309,6 +346,12 @@ def parse_args(arglist):
     parser.add_argument("-l", "--length", type=str, default="short",
         choices=["short", "long"],
         help="length of the game, options are 'short' and 'long'")
+    parser.add_argument("-p", "--policy-dir", type=str, default=POLICY_DIR,
+        help="folder of trained cat policies, the cat falls back to its "
+        "built in strategy if its deck has not been trained")
+    parser.add_argument("-s", "--spectate", type=int, default=None,
+        metavar="PORT",
+        help="let others watch the battle with 'python spectator.py PORT'")
     
     return parser.parse_args(arglist)
 
@@ -352,6 +395,20 @@ if __name__ == "__main__":
     if args.difficulty == "hard":
         cat_hp += 100
         
+    cat_policy = load_policy(cat_deck, args.policy_dir)
+    
+    feed = None
+    if args.spectate is not None:
+        feed = SpectatorFeed(port=args.spectate)
+        try:
+            feed.start()
+            print("Spectators can watch with: python spectator.py "
+                  + f"{feed.port}\n")
+        except OSError as error:
+            print(f"Could not share the battle on port {args.spectate} "
+                  + f"({error.strerror}), playing without spectators\n")
+            feed = None
+    
     player = Player("Player", player_hp)
     cat = Player("Cat", cat_hp)
     count = 1
@@ -360,22 +417,36 @@ if __name__ == "__main__":
         print(f"_____________________________________________________________\n"
               + f"\nTurn {count}\n")
         card = game_menu(player_deck, player, cat)
-        apply_card_effect(card, player, cat, count) 
+        landed, damage = apply_card_effect(card, player, cat, count)
+        if feed:
+            feed.publish(turn_event(count, card, player, cat, landed, damage))
         if cat.is_defeated():
+            if feed:
+                feed.publish({'event': 'end', 'winner': player.name})
             print("You win!\n")
             print(r'''      |\      _,,,---,,_
 ZZZzz /,`.-'`'    -.  ;-;;,_
      |,4-  ) )-,_. ,\ (  `'-'
     '---''(_/--'  `-'\_)''')
             break
-        computerTurn = computer_card_draw(player.health, cat.health, 
-                                          cat_deck, player_deck, cat)
-        apply_card_effect(computerTurn, cat, player, count)
+        computerTurn = cat_policy.choose(player, cat) if cat_policy else None
+        if computerTurn is None:
+            computerTurn = computer_card_draw(player.health, cat.health, 
+                                              cat_deck, player_deck, cat)
+        landed, damage = apply_card_effect(computerTurn, cat, player, count)
+        if feed:
+            feed.publish(turn_event(count, computerTurn, cat, player, landed,
+                                    damage))
         if player.is_defeated():
+            if feed:
+                feed.publish({'event': 'end', 'winner': cat.name})
             print("Cat wins!\n")
             print(r'''    |\__/,|   (`\\
   _.|o o  |_   ) )
 -(((---(((--------''')
             break
         
-        count += 1
\ No newline at end of file
+        count += 1
+    
+    if feed:
+        feed.close()
@@ -1,3 +1,4 @@
+import itertools
 import re
 import random
 
@@ -94,24 +95,19 @@ class Card:
                 + f"{int(self.magnitude*100)}% debuff to your cats' defense "
                 + f'with {int(self.accuracy*100)}% accuracy')
 
-# deck function
-def make_deck(path, max_count, max_power):
+# card file reader
+def read_cards(path):
     """
-    Author: Benjamin Weber
     Technique: regular expressions
     
-    Creates multiple decks at the beginning of the game that the user can choose 
-    from. Chooses cards with assigned strength points. The sum of these values 
-    shoud not go higher than a specified max power level. Every deck should have 
-    at least one attack and one buff/debuff card.
+    Reads a card file and splits its cards into attacks and buffs/debuffs
     
     Args:
-        path (str): path to text file of cards to pull from
-        max_count (int): maximum amount of cards that can be in a deck
-        max_power (int): maximum total 'power' values of cards 
+        path (str): path to text file of cards
+    
+    Returns:
+        2 lists of Card objects, the attack cards and the buff/debuff cards
     """
-    deck = list()
-    power = 0
     attacks = list()
     buffs = list()
 
@@ -144,6 +140,28 @@ def make_deck(path, max_count, max_power):
                                         float(card.group('power_level')),
                                         float(card.group('accuracy')),))
 
+    return attacks, buffs
+
+# deck function
+def make_deck(path, max_count, max_power):
+    """
+    Author: Benjamin Weber
+    Technique: regular expressions
+    
+    Creates multiple decks at the beginning of the game that the user can choose 
+    from. Chooses cards with assigned strength points. The sum of these values 
+    shoud not go higher than a specified max power level. Every deck should have 
+    at least one attack and one buff/debuff card.
+    
+    Args:
+        path (str): path to text file of cards to pull from
+        max_count (int): maximum amount of cards that can be in a deck
+        max_power (int): maximum total 'power' values of cards 
+    """
+    deck = list()
+    power = 0
+    attacks, buffs = read_cards(path)
+
     # add one random attack and remove from list
     current_card = attacks.pop(random.randint(0, len(attacks) - 1))
     power += current_card.power_level
@@ -191,6 +209,61 @@ def make_deck(path, max_count, max_power):
         
     return deck
 
+# every deck make_deck can build
+def all_decks(path, max_count, max_power):
+    """
+    Technique: itertools combinations
+    
+    Lists every distinct deck make_deck(path, max_count, max_power) can 
+    return. A deck is one make_deck can build if it has at least one attack 
+    and one buff/debuff card and is within max_count and max_power, and 
+    either:
+    - has fewer than max_count cards and no other card would still fit, or
+    - has max_count cards and one of them, other than the first attack and 
+      buff/debuff, is as strong as the strongest card that still fit when it
+      was added last
+    
+    Args:
+        path (str): path to text file of cards to pull from
+        max_count (int): maximum amount of cards that can be in a deck
+        max_power (int): maximum total 'power' values of cards 
+    
+    Returns:
+        list of decks (lists of Card objects)
+    """
+    attacks, buffs = read_cards(path)
+    cards = attacks + buffs
+    decks = list()
+
+    def has_both(combo):
+        return any(card.type == 'attack' for card in combo) and \
+            any(card.type != 'attack' for card in combo)
+
+    for count in range(2, max_count + 1):
+        for combo in itertools.combinations(cards, count):
+            power = sum(card.power_level for card in combo)
+            if power > max_power or not has_both(combo):
+                continue
+
+            if count < max_count:
+                # make_deck only stops early once nothing else fits
+                if all(power + card.power_level > max_power for card in cards
+                       if card not in combo):
+                    decks.append(list(combo))
+                continue
+
+            # the last card make_deck adds is one of the strongest that fit
+            for last in combo:
+                rest = [card for card in combo if card is not last]
+                room = max_power - (power - last.power_level)
+                strongest = max(card.power_level for card in cards
+                                if card not in rest and card.power_level <= room)
+                if has_both(rest) and last.power_level == strongest:
+                    decks.append(list(combo))
+                    break
+
+    return decks
+
 # for testing
 if __name__ == "__main__":
 
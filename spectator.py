@@ -0,0 +1,307 @@
+import asyncio
+import json
+import sys
+import threading
+from argparse import ArgumentParser
+from collections import deque
+
+# how many unsent events each spectator can fall behind by before the oldest
+# ones are dropped. every event carries both players' full stats, so a
+# spectator that skips some still sees the right state on the next one
+QUEUE_SIZE = 64
+# how many spectators can be waiting to be accepted at once. asyncio's default
+# of 100 drops connections when a crowd joins together, the kernel still caps
+# it at somaxconn
+BACKLOG = 4096
+
+
+def turn_event(turn, card, user, target, landed, damage):
+    """Builds the event sent to spectators after a card is played
+
+    Args:
+        turn (int): the current turn number
+        card (Card): the card that was played
+        user (Player object): the player who played the card
+        target (Player object): the other player
+        landed (bool): whether the card hit
+        damage (int): damage the card did
+
+    Returns:
+        dict
+    """
+    return {
+        'event': 'turn',
+        'turn': turn,
+        'user': user.name,
+        'card': card.name,
+        'type': card.type,
+        'landed': landed,
+        'damage': damage,
+        'players': [
+            {'name': player.name, 'health': player.health,
+             'attack': round(player.attack_multiplier, 2),
+             'defense': round(player.defense_multiplier, 2)}
+            for player in (user, target)
+        ],
+    }
+
+
+class _Subscriber:
+    """
+    One connected spectator with its own bounded queue of encoded events
+
+    Attributes:
+        queue (deque): encoded events waiting to be sent, oldest dropped
+            first when full
+        ready (asyncio.Event): set when there is something to send
+        dropped (int): events dropped since the last send
+        writer (StreamWriter): the spectator's connection
+        task (asyncio.Task): the task sending to the spectator
+    """
+
+    def __init__(self, queue_size, writer):
+        """
+        Creates a _Subscriber object
+
+        Args:
+            queue_size (int): most events waiting to be sent
+            writer (StreamWriter): the spectator's connection
+        """
+        self.queue = deque(maxlen=queue_size)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        self.writer = writer
+        self.task = asyncio.current_task()
+
+
+class SpectatorFeed:
+    """
+    Techniques: asyncio, threading
+
+    Publishes battle events to any number of spectators over a local TCP
+    socket, one JSON object per line. The server runs on an asyncio loop in
+    a background thread so the game loop (which blocks on input()) only ever
+    hands events over and never waits on a spectator. Each event is encoded
+    once and the same bytes are queued for every spectator
+
+    Attributes:
+        host (str): address the server listens on
+        port (int): port the server listens on (the real one after start(),
+            if 0 was asked for)
+        queue_size (int): most unsent events per spectator
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, queue_size=QUEUE_SIZE):
+        """
+        Creates a SpectatorFeed object, call start() to begin listening
+
+        Args:
+            host (str, optional): address to listen on
+            port (int, optional): port to listen on, 0 picks a free one
+            queue_size (int, optional): most unsent events per spectator
+        """
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._closing = False
+
+    def start(self):
+        """
+        Starts the server thread and waits until it is listening
+
+        Side effects:
+            starts a background thread and opens a listening socket
+
+        Raises:
+            OSError: if the server could not listen on host and port
+        """
+        started = threading.Event()
+        errors = list()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._serve, self.host, self.port,
+                                         backlog=BACKLOG))
+            except OSError as error:
+                errors.append(error)
+                started.set()
+                self._loop.close()
+                return
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            raise errors[0]
+
+    async def _serve(self, reader, writer):
+        """
+        Sends queued events to one spectator until they disconnect or the
+        feed closes. Everything waiting in the queue goes out in one write
+        """
+        subscriber = _Subscriber(self.queue_size, writer)
+        self._subscribers.add(subscriber)
+        try:
+            while True:
+                await subscriber.ready.wait()
+                subscriber.ready.clear()
+                if subscriber.dropped:
+                    writer.write(json.dumps({'event': 'dropped',
+                        'count': subscriber.dropped}).encode() + b'\n')
+                    subscriber.dropped = 0
+                if subscriber.queue:
+                    writer.writelines(subscriber.queue)
+                    subscriber.queue.clear()
+                    await writer.drain()
+                # more may have been queued while drain() waited, so only
+                # stop once a closing feed has nothing left for this spectator
+                if self._closing and not subscriber.queue \
+                        and not subscriber.dropped:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._subscribers.discard(subscriber)
+            writer.close()
+
+    def _fan_out(self, data):
+        """
+        Queues one encoded event for every spectator. Runs on the server
+        loop, and only touches each spectator's queue, never its socket
+        """
+        for subscriber in self._subscribers:
+            if len(subscriber.queue) == self.queue_size:
+                subscriber.dropped += 1
+            subscriber.queue.append(data)
+            subscriber.ready.set()
+
+    def publish(self, event):
+        """
+        Sends an event to every spectator. Safe to call from the game loop,
+        returns straight away
+
+        Args:
+            event (dict): JSON serializable event, e.g. from turn_event()
+        """
+        if self._loop is None or self._closing:
+            return
+        data = json.dumps(event).encode('utf-8') + b'\n'
+        self._loop.call_soon_threadsafe(self._fan_out, data)
+
+    async def _shutdown(self):
+        """
+        Stops accepting spectators and gives each one a second to finish
+        sending what is already queued. Spectators that have stopped reading
+        are cut off so nothing is left pending when the loop stops
+        """
+        self._closing = True
+        self._server.close()
+        subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.ready.set()
+
+        tasks = [subscriber.task for subscriber in subscribers]
+        if tasks:
+            pending = (await asyncio.wait(tasks, timeout=1))[1]
+            # dropping the connection wakes a task stuck in drain() so it
+            # ends by itself, cancelling it instead gets logged by asyncio
+            for subscriber in subscribers:
+                if subscriber.task in pending:
+                    subscriber.writer.transport.abort()
+            await asyncio.gather(*pending, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def close(self):
+        """
+        Flushes what spectators have queued, disconnects them and stops the
+        server thread
+
+        Side effects:
+            closes the listening socket and all spectator connections
+        """
+        if self._loop is None or self._closing:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop) \
+            .result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+async def watch(host, port):
+    """Techniques: asyncio
+
+    Connects to a SpectatorFeed and prints the battle as it happens
+
+    Args:
+        host (str): address of the game
+        port (int): port of the game
+
+    Side effects:
+        prints to stdout
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        event = json.loads(line)
+
+        if event['event'] == 'turn':
+            if not event['landed']:
+                result = 'missed'
+            elif event['type'] == 'attack':
+                result = f"hit for {event['damage']}"
+            else:
+                result = 'landed'
+            print(f"Turn {event['turn']}: {event['user']} used "
+                  + f"{event['card']}, {result}")
+            for player in event['players']:
+                print(f"\t{player['name']}: HP = {player['health']}, Attack "
+                      + f"Multiplier = {player['attack']}, Defense "
+                      + f"Multiplier = {player['defense']}")
+        elif event['event'] == 'end':
+            print(f"{event['winner']} wins!")
+        elif event['event'] == 'dropped':
+            print(f"(missed {event['count']} events)")
+    writer.close()
+
+
+def parse_args(arglist):
+    """Techniques: ArgumentParser
+
+    parses command line arguments for watching a game
+
+    Args:
+        arglist (list of str): arguments from the command line
+
+    Returns:
+        namespace: the parsed arguments as a namespace
+    """
+    parser = ArgumentParser(description="watch a game of Purrsevere")
+    parser.add_argument("port", type=int, nargs="?", default=8765,
+        help="port the game is sharing on")
+    parser.add_argument("--host", type=str, default="127.0.0.1",
+        help="address of the game")
+
+    return parser.parse_args(arglist)
+
+
+if __name__ == "__main__":
+
+    args = parse_args(sys.argv[1:])
+    try:
+        asyncio.run(watch(args.host, args.port))
+    except ConnectionRefusedError:
+        print(f"No game found on {args.host}:{args.port}")
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,189 @@
+"""Checks the mergeable accumulators and the simulator in battle_stats
+
+Run with ``python -m pytest test_battle_stats.py`` or
+``python test_battle_stats.py``
+"""
+import math
+import random
+import statistics
+from battle_stats import (BattleStats, CardCounter, DeckStats, QuantileSketch,
+                          Reservoir, RunningStats, simulate, wilson_interval)
+from make_deck import make_deck
+
+
+def _exact_quantile(values, q):
+    """Quantile the same way QuantileSketch ranks values"""
+    return sorted(values)[int(q * (len(values) - 1))]
+
+
+def test_running_stats_merge_matches_a_single_pass():
+    rng = random.Random(1)
+    values = [rng.gauss(50, 12) for _ in range(10001)]
+    single = RunningStats()
+    for value in values:
+        single.add(value)
+
+    # uneven parts, and an empty one, merged in different orders
+    parts = [values[:10], values[10:4000], [], values[4000:]]
+    merged = RunningStats()
+    for part in reversed(parts):
+        stats = RunningStats()
+        for value in part:
+            stats.add(value)
+        merged.merge(stats)
+
+    for stats in (single, merged):
+        assert stats.count == len(values)
+        assert math.isclose(stats.mean, statistics.mean(values))
+        assert math.isclose(stats.variance(), statistics.variance(values))
+        assert stats.minimum == min(values)
+        assert stats.maximum == max(values)
+
+
+def test_quantile_sketch_merges_different_bin_widths():
+    rng = random.Random(2)
+    short_games = [rng.randint(2, 20) for _ in range(5000)]
+    long_games = [rng.randint(2, 2000) for _ in range(5000)]
+
+    narrow = QuantileSketch(max_bins=64)
+    for value in short_games:
+        narrow.add(value)
+    wide = QuantileSketch(max_bins=64)
+    for value in long_games:
+        wide.add(value)
+    assert narrow.width == 1
+    assert wide.width > 1
+
+    values = short_games + long_games
+    merges = list()
+    for first, second in ((narrow, wide), (wide, narrow)):
+        merged = QuantileSketch(max_bins=64)
+        merged.merge(first)
+        merged.merge(second)
+        assert merged.count == len(values)
+        assert len(merged.bins) <= merged.max_bins
+        for q in (0.1, 0.5, 0.9, 0.99):
+            assert abs(merged.quantile(q) - _exact_quantile(values, q)) \
+                <= merged.width
+        merges.append(merged)
+
+    # the order of the merges doesn't matter
+    assert merges[0].width == merges[1].width
+    assert merges[0].bins == merges[1].bins
+
+
+def test_reservoir_merge_is_unbiased():
+    # one side saw a quarter of the stream, so a quarter of the merged
+    # sample should come from it
+    rng = random.Random(3)
+    from_small = 0
+    kept = 0
+    for _ in range(4000):
+        small = Reservoir(10, rng.random())
+        for item in range(300):
+            small.add(('small', item))
+        large = Reservoir(10, rng.random())
+        for item in range(900):
+            large.add(('large', item))
+
+        small.merge(large)
+        assert small.seen == 1200
+        assert len(small.samples) == 10
+        from_small += sum(1 for side, _ in small.samples if side == 'small')
+        kept += len(small.samples)
+
+    assert abs(from_small / kept - 0.25) < 0.01
+
+
+def test_reservoir_is_uniform_over_the_stream():
+    counts = [0] * 100
+    for seed in range(3000):
+        reservoir = Reservoir(5, seed)
+        for item in range(100):
+            reservoir.add(item)
+        for item in reservoir.samples:
+            counts[item] += 1
+    # every item should be kept about 3000 * 5 / 100 = 150 times
+    assert all(100 < count < 200 for count in counts)
+
+
+def test_card_counter_and_deck_stats_merge():
+    first = CardCounter()
+    first.add('bite', True, 50)
+    first.add('bite', False, 0)
+    second = CardCounter()
+    second.add('bite', True, 55)
+    second.add('hiss', True, 0)
+    first.merge(second)
+    assert first.cards == {'bite': [3, 2, 105], 'hiss': [1, 1, 0]}
+
+    deck = DeckStats('deck')
+    deck.add(True, 4, 30)
+    deck.add(None, 200)
+    other = DeckStats('deck')
+    other.add(False, 6, 10)
+    deck.merge(other)
+    assert (deck.games, deck.wins, deck.draws) == (3, 1, 1)
+    # draws count as games but not towards the win rate or winner hp
+    assert deck.win_rate() == 0.5
+    assert deck.winner_hp.count == 2
+    assert deck.turns.count == 3
+
+
+def test_wilson_interval():
+    low, high = wilson_interval(50, 100)
+    assert low < 0.5 < high
+    assert math.isclose(low, 1 - high)
+    assert wilson_interval(0, 10)[0] == 0.0
+    assert wilson_interval(10, 10)[1] == 1.0
+
+
+def test_seeded_simulation_repeats_with_any_worker_count():
+    deck_rng = random.Random(4)
+    random.seed(deck_rng.random())
+    cat_decks = [make_deck('cat_cards.txt', 6, 15) for _ in range(2)]
+
+    random.seed(5)
+    expected = random.random()
+    random.seed(5)
+    runs = [simulate(cat_decks, 3000, workers=workers, batch_size=500,
+                     seed=7, policy_dir='no policies here')
+            for workers in (1, 1, 2)]
+    # simulating does not touch the caller's global random
+    assert random.random() == expected
+
+    def summary(stats):
+        return ([(deck.games, deck.wins, deck.draws, deck.turns.mean)
+                 for _, deck in sorted(stats.decks.items())],
+                sorted(stats.cards.cards.items()), stats.samples.samples)
+
+    assert summary(runs[0]) == summary(runs[1]) == summary(runs[2])
+    assert sum(deck.games for deck in runs[0].decks.values()) == 3000
+
+
+def test_simulate_rejects_bad_arguments():
+    cat_decks = [make_deck('cat_cards.txt', 6, 15)]
+    for kwargs in ({'cat_decks': [], 'games': 10},
+                   {'cat_decks': cat_decks, 'games': -1},
+                   {'cat_decks': cat_decks, 'games': 10, 'max_turns': 0},
+                   {'cat_decks': cat_decks, 'games': 10,
+                    'owner_policies': ['nobody']}):
+        try:
+            simulate(workers=1, **kwargs)
+        except ValueError:
+            continue
+        raise AssertionError(f"simulate() should reject {kwargs}")
+
+    assert simulate(cat_decks, 0, workers=1).decks == BattleStats().decks
+
+
+if __name__ == "__main__":
+    test_running_stats_merge_matches_a_single_pass()
+    test_quantile_sketch_merges_different_bin_widths()
+    test_reservoir_merge_is_unbiased()
+    test_reservoir_is_uniform_over_the_stream()
+    test_card_counter_and_deck_stats_merge()
+    test_wilson_interval()
+    test_seeded_simulation_repeats_with_any_worker_count()
+    test_simulate_rejects_bad_arguments()
+    print("all battle stats checks passed")
@@ -0,0 +1,225 @@
+"""Checks SpectatorFeed with local clients only
+
+Run with ``python -m pytest test_spectator.py`` or ``python test_spectator.py``
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+from spectator import SpectatorFeed
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+SPECTATORS = 2000
+# every spectator uses a socket on each end, plus some left for everything else
+FILES_NEEDED = SPECTATORS * 2 + 100
+EVENTS = 2000
+QUEUE_SIZE = 16
+# big enough that a spectator who isn't reading fills the socket buffers
+# long before the game ends
+PADDING = 'x' * 20000
+
+
+def _raise_file_limit(needed):
+    """Raises the soft open file limit towards the hard one, returns why it
+    can't be raised far enough or None if it was"""
+    if resource is None:
+        return "can't check the open file limit on this platform"
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft >= needed:
+        return None
+    if hard != resource.RLIM_INFINITY and hard < needed:
+        return f"needs {needed} open files but the hard limit is {hard}"
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+    except (ValueError, OSError) as error:
+        return f"couldn't raise the open file limit to {needed}: {error}"
+    return None
+
+
+async def _spectate(port, connected, results):
+    """Reads one spectator's stream until the feed disconnects it"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    connected.append(True)
+    turns = dropped = 0
+    last = None
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        event = json.loads(line)
+        if event['event'] == 'dropped':
+            dropped += event['count']
+        elif event['event'] == 'turn':
+            turns += 1
+        last = event
+    writer.close()
+    results.append((turns, dropped, last))
+
+
+def _start_spectators(port, count):
+    """Connects count reading spectators on a separate event loop thread"""
+    connected = list()
+    results = list()
+
+    async def spectate_all():
+        await asyncio.gather(*(_spectate(port, connected, results)
+                               for _ in range(count)))
+
+    thread = threading.Thread(target=asyncio.run, args=(spectate_all(),))
+    thread.start()
+    while len(connected) < count:
+        time.sleep(0.01)
+    return thread, results
+
+
+def _read_stalled(sock):
+    """Reads everything a stalled spectator was sent, up to the end event"""
+    sock.settimeout(10)
+    turns = dropped = 0
+    last = None
+    for line in sock.makefile('rb'):
+        event = json.loads(line)
+        if event['event'] == 'dropped':
+            dropped += event['count']
+        elif event['event'] == 'turn':
+            turns += 1
+        last = event
+        if event['event'] == 'end':
+            break
+    return turns, dropped, last
+
+
+def _publish_game(feed, events, padding=''):
+    """Publishes a game of events and returns the slowest publish() time"""
+    slowest = 0.0
+    for turn in range(events):
+        start = time.perf_counter()
+        feed.publish({'event': 'turn', 'turn': turn, 'padding': padding})
+        slowest = max(slowest, time.perf_counter() - start)
+    feed.publish({'event': 'end', 'winner': 'Cat'})
+    return slowest
+
+
+def test_thousands_of_spectators_get_every_turn():
+    reason = _raise_file_limit(FILES_NEEDED)
+    if reason:
+        import pytest
+        pytest.skip(f"{SPECTATORS} spectators: {reason}")
+    feed = SpectatorFeed(port=0, queue_size=QUEUE_SIZE)
+    feed.start()
+    thread, results = _start_spectators(feed.port, SPECTATORS)
+    # the server registers spectators on its own loop, wait until it has
+    while len(feed._subscribers) < SPECTATORS:
+        time.sleep(0.01)
+
+    slowest = _publish_game(feed, 200)
+    feed.close()
+    thread.join(timeout=60)
+
+    # publishing only hands the event to the server thread
+    assert slowest < 0.1
+    # a spectator that fell behind is told how many turns it missed
+    assert len(results) == SPECTATORS
+    for turns, dropped, last in results:
+        assert turns + dropped == 200
+        assert last == {'event': 'end', 'winner': 'Cat'}
+
+
+def test_stalled_spectator_drops_turns_without_stalling_the_game():
+    feed = SpectatorFeed(port=0, queue_size=QUEUE_SIZE)
+    feed.start()
+    stalled = socket.create_connection(('127.0.0.1', feed.port))
+    thread, results = _start_spectators(feed.port, 1)
+    while len(feed._subscribers) < 2:
+        time.sleep(0.01)
+
+    slowest = _publish_game(feed, EVENTS, PADDING)
+    # the stalled spectator only starts reading once the game is over
+    time.sleep(0.5)
+    stalled_turns, stalled_dropped, stalled_last = _read_stalled(stalled)
+    feed.close()
+    thread.join(timeout=30)
+    stalled.close()
+
+    assert slowest < 0.1
+    # the stalled spectator fell behind, lost old turns and was told so
+    assert stalled_dropped > 0
+    assert stalled_turns + stalled_dropped == EVENTS
+    assert stalled_last == {'event': 'end', 'winner': 'Cat'}
+    # and the spectator who kept reading was not held back by it
+    turns, dropped, last = results[0]
+    assert turns + dropped == EVENTS
+    assert last == {'event': 'end', 'winner': 'Cat'}
+
+
+def test_close_flushes_a_slow_spectator_that_catches_up():
+    feed = SpectatorFeed(port=0, queue_size=QUEUE_SIZE)
+    feed.start()
+    slow = socket.create_connection(('127.0.0.1', feed.port))
+    while not feed._subscribers:
+        time.sleep(0.01)
+
+    _publish_game(feed, EVENTS, PADDING)
+    # the game closes the feed right after the end event, the spectator only
+    # starts reading once close() is already waiting on it
+    closing = threading.Thread(target=feed.close)
+    closing.start()
+    time.sleep(0.3)
+    turns, dropped, last = _read_stalled(slow)
+    closing.join(timeout=10)
+    slow.close()
+
+    assert dropped > 0
+    assert turns + dropped == EVENTS
+    assert last == {'event': 'end', 'winner': 'Cat'}
+
+
+def test_close_cuts_off_spectators_that_stopped_reading():
+    feed = SpectatorFeed(port=0, queue_size=QUEUE_SIZE)
+    feed.start()
+    stalled = socket.create_connection(('127.0.0.1', feed.port))
+    while not feed._subscribers:
+        time.sleep(0.01)
+
+    for turn in range(EVENTS):
+        feed.publish({'event': 'turn', 'turn': turn, 'padding': PADDING})
+
+    start = time.perf_counter()
+    feed.close()
+    assert time.perf_counter() - start < 5
+    assert not feed._thread.is_alive()
+    stalled.close()
+
+
+def test_port_in_use_raises():
+    taken = socket.socket()
+    taken.bind(('127.0.0.1', 0))
+    taken.listen()
+    feed = SpectatorFeed(port=taken.getsockname()[1])
+    try:
+        feed.start()
+    except OSError:
+        pass
+    else:
+        feed.close()
+        raise AssertionError("start() should fail on a port in use")
+    finally:
+        taken.close()
+
+
+if __name__ == "__main__":
+    reason = _raise_file_limit(FILES_NEEDED)
+    if reason:
+        print(f"skipped {SPECTATORS} spectators: {reason}")
+    else:
+        test_thousands_of_spectators_get_every_turn()
+    test_stalled_spectator_drops_turns_without_stalling_the_game()
+    test_close_flushes_a_slow_spectator_that_catches_up()
+    test_close_cuts_off_spectators_that_stopped_reading()
+    test_port_in_use_raises()
+    print("all spectator checks passed")